@@ -2,10 +2,31 @@ import streamlit as st
 import pandas as pd
 import os
 from db_connection import get_connection
+from trigger_bench import BenchmarkSkipped, analyze_trigger, existing_triggers
+from jobs import enqueue, recent_jobs, start_runner
+from playlist_tracks import SORT_COLUMNS, fetch_track_page
+from song_media import SearchCache, resolve_embed, search_songs
 
 st.set_page_config(page_title="🎵 Music DBMS Frontend", layout="wide")
 st.title("🎶 Music Database Management System")
 
+
+@st.cache_resource
+def get_search_cache():
+    # One search cache per server process, shared by all sessions
+    return SearchCache()
+
+
+@st.cache_resource
+def get_job_runner(_search_cache):
+    # One runner per server process, shared by all sessions; start_runner stops
+    # the one a cleared cache left behind. Workers get the cache itself: they
+    # have no script run context to call cached functions.
+    return start_runner(on_done=lambda job: _search_cache.clear())
+
+
+get_job_runner(get_search_cache())
+
 menu = [
     "View Tables",
     "Add Song",
@@ -17,7 +38,8 @@ menu = [
     "View Triggers & Procedures",
     "Manage Songs in Playlists",
     "Add Trigger",  # <-- existing
-    "Add User"      # new menu item for adding users
+    "Add User",     # new menu item for adding users
+    "Background Jobs"
 ]
 
 choice = st.sidebar.radio("📋 Menu", menu)
@@ -46,11 +68,14 @@ elif choice == "Add Song":
         conn = get_connection()
         cursor = conn.cursor()
         try:
+            provider, embed_url = resolve_embed(link)
             cursor.execute(
-                "INSERT INTO songs (songId, title, releaseDate, duration, song_link) VALUES (%s, %s, %s, %s, %s)",
-                (sid, title, release, duration, link)
+                "INSERT INTO songs (songId, title, releaseDate, duration, song_link, embed_provider, embed_url) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                (sid, title, release, duration, link, provider, embed_url)
             )
             conn.commit()
+            get_search_cache().clear()
             st.success(f"✅ Song '{title}' added successfully!")
         except Exception as e:
             err_msg = str(e)
@@ -63,40 +88,33 @@ elif choice == "Add Song":
             cursor.close()
             conn.close()
 
-        st.markdown("---")
-        st.subheader("🗑️ Delete a Song")
+    st.markdown("---")
+    st.subheader("🗑️ Delete a Song")
+    try:
+        conn_d = get_connection()
+        cur_d = conn_d.cursor(dictionary=True)
+        cur_d.execute("SELECT songId, title FROM songs ORDER BY songId")
+        songs_list = cur_d.fetchall()
+        if not songs_list:
+            st.info("No songs available to delete.")
+        else:
+            song_choices = {f"{s['songId']} - {s['title']}": s['songId'] for s in songs_list}
+            selected_del = st.selectbox("Select a song to delete", list(song_choices.keys()))
+            if st.button("Delete Song"):
+                sid_del = song_choices[selected_del]
+                try:
+                    job_id = enqueue("delete_song", sid_del)
+                    st.success(f"✅ Queued deletion of song {selected_del} as job #{job_id}. Track it under \"Background Jobs\".")
+                except Exception as e:
+                    st.error(f"❌ Failed to queue song deletion: {e}")
+    except Exception as e:
+        st.error(f"❌ Could not load songs for deletion: {e}")
+    finally:
         try:
-            conn_d = get_connection()
-            cur_d = conn_d.cursor(dictionary=True)
-            cur_d.execute("SELECT songId, title FROM songs ORDER BY songId")
-            songs_list = cur_d.fetchall()
-            if not songs_list:
-                st.info("No songs available to delete.")
-            else:
-                song_choices = {f"{s['songId']} - {s['title']}": s['songId'] for s in songs_list}
-                selected_del = st.selectbox("Select a song to delete", list(song_choices.keys()))
-                if st.button("Delete Song"):
-                    sid_del = song_choices[selected_del]
-                    try:
-                        cur_del = conn_d.cursor()
-                        cur_del.execute("DELETE FROM songs WHERE songId = %s", (sid_del,))
-                        conn_d.commit()
-                        st.success(f"✅ Deleted song {selected_del}")
-                        # close and refresh
-                        cur_del.close()
-                        cur_d.close()
-                        conn_d.close()
-                        st.experimental_rerun()
-                    except Exception as e:
-                        st.error(f"❌ Failed to delete song: {e}")
-        except Exception as e:
-            st.error(f"❌ Could not load songs for deletion: {e}")
-        finally:
-            try:
-                cur_d.close()
-                conn_d.close()
-            except Exception:
-                pass
+            cur_d.close()
+            conn_d.close()
+        except Exception:
+            pass
 
 
 elif choice == "Search Songs":
@@ -105,39 +123,39 @@ elif choice == "Search Songs":
     query = st.text_input("Enter song title")
 
     if query:
-        # Fetch matching songs
-        cursor.execute("SELECT * FROM songs WHERE title LIKE %s", (f"%{query}%",))
-        results = cursor.fetchall()
+        # Fetch matching songs (cached per query, keyed by songId)
+        results = search_songs(cursor, get_search_cache(), query)
 
         if not results:
             st.warning("⚠️ No matching songs found.")
         else:
-            df = pd.DataFrame(results)
+            df = pd.DataFrame(list(results.values())).drop(columns=["embed_provider", "embed_url"], errors="ignore")
             st.dataframe(df)
 
             # Select one of the found songs to play
-            song_titles = [r["title"] for r in results]
-            selected_song = st.selectbox("🎵 Select a song to play", song_titles)
+            selected_id = st.selectbox(
+                "🎵 Select a song to play", list(results.keys()),
+                format_func=lambda sid: f"{sid} - {results[sid]['title']}"
+            )
 
-            if selected_song:
-                cursor.execute(
-                    "SELECT song_link FROM songs WHERE title = %s", (selected_song,)
-                )
-                song_data = cursor.fetchone()
+            if selected_id is not None:
+                song_data = results[selected_id]
+                provider, embed_url = song_data.get("embed_provider"), song_data.get("embed_url")
+                if provider is None and song_data["song_link"]:
+                    provider, embed_url = resolve_embed(song_data["song_link"])
 
-                if song_data and song_data["song_link"]:
+                if provider:
                     link = song_data["song_link"]
 
                     st.markdown("---")
-                    st.subheader(f"▶️ Now Playing: {selected_song}")
+                    st.subheader(f"▶️ Now Playing: {song_data['title']}")
 
                     # For YouTube links → embed in an iframe
-                    if "youtube.com" in link or "youtu.be" in link:
-                        youtube_embed = link.replace("watch?v=", "embed/")
+                    if provider == "youtube":
                         st.markdown(
                             f"""
                             <iframe width="700" height="394" 
-                            src="{youtube_embed}"
+                            src="{embed_url}"
                             frameborder="0" allow="autoplay; encrypted-media" allowfullscreen>
                             </iframe>
                             """,
@@ -145,11 +163,11 @@ elif choice == "Search Songs":
                         )
 
                     # For Spotify links → Spotify embed
-                    elif "spotify.com" in link:
+                    elif provider == "spotify":
                         st.markdown(
                             f"""
                             <iframe style="border-radius:12px" 
-                            src="{link.replace('track', 'embed/track')}" 
+                            src="{embed_url}" 
                             width="700" height="394" frameborder="0" 
                             allow="autoplay; clipboard-write; encrypted-media; picture-in-picture" 
                             loading="lazy"></iframe>
@@ -425,34 +443,55 @@ elif choice == "View Songs in Playlist":
             if selected_playlist:
                 playlist_id = playlist_dict[selected_playlist]
 
-                # Step 3: Fetch all songs in that playlist
-                cursor.execute("""
-                    SELECT s.songId, s.title, s.duration, s.releaseDate, s.song_link, a.name AS artist
-                    FROM playlistsongs ps
-                    JOIN songs s ON ps.songId = s.songId
-                    LEFT JOIN artistsong ars ON s.songId = ars.songId
-                    LEFT JOIN artists a ON ars.artistId = a.artistId
-                    WHERE ps.playlistId = %s
-                    ORDER BY s.title;
-                """, (playlist_id,))
-                songs = cursor.fetchall()
-
-                if songs:
-                    st.success(f"✅ Found {len(songs)} song(s) in '{selected_playlist}'")
-                    df = pd.DataFrame(songs)
-                    st.dataframe(df)
-
-                    # Optional: Show total duration
-                    cursor.execute("""
-                        SELECT total_duration 
-                        FROM playlists 
-                        WHERE playlistId = %s
-                    """, (playlist_id,))
-                    total = cursor.fetchone()
-                    if total and total['total_duration']:
-                        minutes = total['total_duration'] // 60
-                        seconds = total['total_duration'] % 60
+                col1, col2 = st.columns(2)
+                with col1:
+                    order = st.selectbox("Order by", list(SORT_COLUMNS))
+                with col2:
+                    page_size = st.selectbox("Songs per page", [25, 50, 100, 200], index=1)
+
+                # Keyset paging: remember where each page starts, reset when the view changes
+                view = (playlist_id, order, page_size)
+                if st.session_state.get("track_view") != view:
+                    st.session_state["track_view"] = view
+                    st.session_state["track_pages"] = [None]
+
+                # Step 3: Fetch one page of tracks (plus playlist totals) in one query
+                tracks, totals, has_more = fetch_track_page(
+                    cursor, playlist_id, order, st.session_state["track_pages"][-1], page_size
+                )
+
+                page_no = len(st.session_state["track_pages"])
+                # The rows decide what is shown; the trigger-maintained counters are display only
+                if tracks or page_no > 1:
+                    if totals and totals["tracks"]:
+                        st.success(f"✅ {totals['tracks']} song(s) in '{selected_playlist}' — page {page_no}")
+                    else:
+                        st.success(f"✅ Songs in '{selected_playlist}' — page {page_no}")
+                    if totals and totals["total_duration"]:
+                        minutes = totals["total_duration"] // 60
+                        seconds = totals["total_duration"] % 60
                         st.info(f"⏱️ Total Duration: {minutes} min {seconds} sec")
+
+                    if tracks:
+                        df = pd.DataFrame(tracks).drop(columns=["sort_key"])
+                        st.dataframe(df)
+                    else:
+                        st.info("ℹ️ No more songs in this playlist.")
+
+                    def next_page(last):
+                        st.session_state["track_pages"].append((last["sort_key"], last["songId"]))
+
+                    def prev_page():
+                        st.session_state["track_pages"].pop()
+
+                    col3, col4 = st.columns(2)
+                    with col3:
+                        st.button("⬅️ Previous", on_click=prev_page, disabled=page_no == 1)
+                    with col4:
+                        st.button(
+                            "Next ➡️", on_click=next_page, args=(tracks[-1],) if tracks else None,
+                            disabled=not has_more
+                        )
                 else:
                     st.info("ℹ️ No songs found in this playlist.")
     except Exception as e:
@@ -499,12 +538,15 @@ elif choice == "Edit Song":
                     # Step 5: Update button
                     if st.button("💾 Update Song"):
                         try:
+                            provider, embed_url = resolve_embed(new_link)
                             cursor.execute("""
                                 UPDATE songs 
-                                SET title = %s, releaseDate = %s, duration = %s, song_link = %s
+                                SET title = %s, releaseDate = %s, duration = %s, song_link = %s,
+                                    embed_provider = %s, embed_url = %s
                                 WHERE songId = %s
-                            """, (new_title, new_release, new_duration, new_link, song_id))
+                            """, (new_title, new_release, new_duration, new_link, provider, embed_url, song_id))
                             conn.commit()
+                            get_search_cache().clear()
                             st.success(f"✅ Song '{new_title}' updated successfully!")
                             st.rerun()  # Refresh page to show updated data
                         except Exception as e:
@@ -556,40 +598,57 @@ elif choice == "Add User":
                 except Exception:
                     pass
 
-        st.markdown("---")
-        st.subheader("🗑️ Delete a User")
+    st.markdown("---")
+    st.subheader("🗑️ Delete a User")
+    try:
+        conn_ud = get_connection()
+        cur_ud = conn_ud.cursor(dictionary=True)
+        cur_ud.execute("SELECT userId, firstName, lastName FROM users ORDER BY userId")
+        users_list = cur_ud.fetchall()
+        if not users_list:
+            st.info("No users available to delete.")
+        else:
+            user_choices = {f"{u['userId']} - {u['firstName']} {u['lastName']}": u['userId'] for u in users_list}
+            sel_user = st.selectbox("Select a user to delete", list(user_choices.keys()))
+            if st.button("Delete User"):
+                uid_del = user_choices[sel_user]
+                try:
+                    # Playlists and other dependent rows are removed in chunks by the job
+                    job_id = enqueue("delete_user", uid_del)
+                    st.success(f"✅ Queued deletion of user {sel_user} as job #{job_id}. Track it under \"Background Jobs\".")
+                except Exception as e:
+                    st.error(f"❌ Failed to queue user deletion: {e}")
+    except Exception as e:
+        st.error(f"❌ Could not load users for deletion: {e}")
+    finally:
         try:
-            conn_ud = get_connection()
-            cur_ud = conn_ud.cursor(dictionary=True)
-            cur_ud.execute("SELECT userId, firstName, lastName FROM users ORDER BY userId")
-            users_list = cur_ud.fetchall()
-            if not users_list:
-                st.info("No users available to delete.")
-            else:
-                user_choices = {f"{u['userId']} - {u['firstName']} {u['lastName']}": u['userId'] for u in users_list}
-                sel_user = st.selectbox("Select a user to delete", list(user_choices.keys()))
-                if st.button("Delete User"):
-                    uid_del = user_choices[sel_user]
-                    try:
-                        cur_delu = conn_ud.cursor()
-                        cur_delu.execute("DELETE FROM users WHERE userId = %s", (uid_del,))
-                        conn_ud.commit()
-                        st.success(f"✅ Deleted user {sel_user}")
-                        cur_delu.close()
-                        cur_ud.close()
-                        conn_ud.close()
-                        st.experimental_rerun()
-                    except Exception as e:
-                        # Likely FK constraint if user owns playlists etc.
-                        st.error(f"❌ Failed to delete user: {e}")
-        except Exception as e:
-            st.error(f"❌ Could not load users for deletion: {e}")
-        finally:
-            try:
-                cur_ud.close()
-                conn_ud.close()
-            except Exception:
-                pass
+            cur_ud.close()
+            conn_ud.close()
+        except Exception:
+            pass
+
+elif choice == "Background Jobs":
+    st.header("⏳ Background Jobs")
+    st.caption("Heavy deletes run in the background in small batches so the app stays responsive.")
+
+    if st.button("🔄 Refresh"):
+        st.rerun()
+
+    try:
+        jobs_list = recent_jobs()
+        if not jobs_list:
+            st.info("ℹ️ No background jobs yet.")
+        else:
+            for job in jobs_list:
+                if job["status"] in ("queued", "running"):
+                    total = job["rows_total"] or 1
+                    label = f"#{job['jobId']} {job['kind']} {job['target']} — {job['status']}"
+                    if job["step"]:
+                        label += f" ({job['step']})"
+                    st.progress(min(1.0, job["rows_done"] / total), text=label)
+            st.dataframe(pd.DataFrame(jobs_list))
+    except Exception as e:
+        st.error(f"❌ Could not load jobs: {e}")
 
 # -------------------------
 # Minimal Add Trigger branch
@@ -650,10 +709,46 @@ elif choice == "Add Trigger":
             )
             return preview, name_safe
 
+        def show_write_cost_report(report):
+            df = pd.DataFrame(report)[[
+                "scenario", "operation", "avg_ms", "p95_ms", "rows_touched_per_row",
+                "write_amplification", "rows_locked_per_row", "server_lock_waits", "server_lock_wait_ms"
+            ]]
+            st.dataframe(df)
+            worst = df[df["scenario"] != "no triggers"]["write_amplification"].max()
+            if worst and worst >= 10:
+                st.warning(f"⚠️ Up to {worst}× write amplification per row — review before using in production.")
+            if report[0]["updated_column"]:
+                update_note = f"UPDATE changes `{report[0]['updated_column']}`"
+            else:
+                update_note = "UPDATE not measured (no non-key column with two distinct sampled values)"
+            if report[0]["rows_locked_per_row"] is None:
+                update_note += "; `rows_locked_per_row` unavailable (needs the PROCESS privilege)"
+            st.caption(
+                f"Measured on {report[0]['sample_rows']} sampled row(s) in a scratch schema, "
+                f"{update_note}; all changes rolled back. "
+                f"`rows_locked_per_row` is this benchmark's own lock footprint; `server_lock_*` are "
+                f"server-wide InnoDB counters for the scenario and include waits from other traffic."
+            )
+
         preview_sql, safe_name = assemble_preview(trig_name, timing, event, table_name, body_sql)
         st.subheader("Preview")
         st.code(preview_sql, language="sql")
 
+        col3, col4 = st.columns(2)
+        with col3:
+            run_bench = st.checkbox("🔬 Benchmark write cost before creating", value=True)
+        with col4:
+            sample_rows = st.number_input("Sample rows", min_value=1, max_value=1000, value=50)
+
+        candidate = {
+            "TRIGGER_NAME": safe_name,
+            "ACTION_TIMING": timing,
+            "EVENT_MANIPULATION": event,
+            "EVENT_OBJECT_TABLE": table_name,
+            "ACTION_STATEMENT": f"BEGIN\n{body_sql}\nEND",
+        }
+
         if st.button("Create Trigger"):
             import re
             if not re.fullmatch(r"[A-Za-z0-9_]+", safe_name):
@@ -663,30 +758,77 @@ elif choice == "Add Trigger":
             elif not body_sql.strip():
                 st.error("Trigger body is empty.")
             else:
-                # Execute with a fresh connection (multi=True to support ; inside body)
-                try:
-                    conn_ct = get_connection()
-                    cur_ct = conn_ct.cursor()
-                    # Some MySQL python drivers (e.g. mysql-connector) accept multi=True to run
-                    # multiple statements in one call. Others (e.g. MySQLdb/C extensions) do not
-                    # accept the `multi` keyword. Try the multi form first, fall back to plain execute.
+                bench_ok = True
+                if run_bench:
+                    st.subheader("📊 Write Cost (sandbox)")
                     try:
-                        for _ in cur_ct.execute(preview_sql, multi=True):
+                        with st.spinner("Benchmarking trigger in a scratch schema..."):
+                            report = analyze_trigger(os.getenv("DB_NAME"), table_name, candidate, sample_rows=sample_rows)
+                        show_write_cost_report(report)
+                    except BenchmarkSkipped as e:
+                        st.warning(f"⚠️ Write cost not measured: {e}")
+                    except Exception as e:
+                        bench_ok = False
+                        st.error(f"❌ Benchmark failed, trigger not created: {e}")
+
+                if bench_ok:
+                    # Execute with a fresh connection (multi=True to support ; inside body)
+                    try:
+                        conn_ct = get_connection()
+                        cur_ct = conn_ct.cursor()
+                        # Some MySQL python drivers (e.g. mysql-connector) accept multi=True to run
+                        # multiple statements in one call. Others (e.g. MySQLdb/C extensions) do not
+                        # accept the `multi` keyword. Try the multi form first, fall back to plain execute.
+                        try:
+                            for _ in cur_ct.execute(preview_sql, multi=True):
+                                pass
+                        except TypeError:
+                            # Driver doesn't accept 'multi' kwarg — execute as a single statement
+                            cur_ct.execute(preview_sql)
+
+                        conn_ct.commit()
+                        st.success(f"✅ Trigger `{safe_name}` created on `{table_name}`.")
+                    except Exception as e:
+                        st.error(f"❌ Failed to create trigger: {e}")
+                    finally:
+                        try:
+                            cur_ct.close()
+                            conn_ct.close()
+                        except Exception:
                             pass
-                    except TypeError:
-                        # Driver doesn't accept 'multi' kwarg — execute as a single statement
-                        cur_ct.execute(preview_sql)
 
-                    conn_ct.commit()
-                    st.success(f"✅ Trigger `{safe_name}` created on `{table_name}`.")
-                except Exception as e:
-                    st.error(f"❌ Failed to create trigger: {e}")
-                finally:
+        st.markdown("---")
+        st.subheader("📊 Write Cost of Existing Triggers")
+        try:
+            conn_wc = get_connection()
+            cur_wc = conn_wc.cursor(dictionary=True)
+            bench_trigs = existing_triggers(cur_wc, os.getenv("DB_NAME"))
+            if not bench_trigs:
+                st.info("No triggers found to analyze.")
+            else:
+                bench_choices = {f"{t['TRIGGER_NAME']} ({t['ACTION_TIMING']} {t['EVENT_MANIPULATION']} ON {t['EVENT_OBJECT_TABLE']})": t for t in bench_trigs}
+                sel_bench = st.selectbox("Select a trigger to analyze", list(bench_choices.keys()))
+                if st.button("Analyze Write Cost"):
+                    trig = bench_choices[sel_bench]
                     try:
-                        cur_ct.close()
-                        conn_ct.close()
-                    except Exception:
-                        pass
+                        with st.spinner("Benchmarking trigger in a scratch schema..."):
+                            report = analyze_trigger(
+                                os.getenv("DB_NAME"), trig["EVENT_OBJECT_TABLE"], trig,
+                                exclude=trig["TRIGGER_NAME"], sample_rows=sample_rows
+                            )
+                        show_write_cost_report(report)
+                    except BenchmarkSkipped as e:
+                        st.warning(f"⚠️ Write cost not measured: {e}")
+                    except Exception as e:
+                        st.error(f"❌ Benchmark failed: {e}")
+        except Exception as e:
+            st.error(f"❌ Could not load triggers for analysis: {e}")
+        finally:
+            try:
+                cur_wc.close()
+                conn_wc.close()
+            except Exception:
+                pass
 
         st.markdown("---")
         st.subheader("🗑️ Drop a Trigger")
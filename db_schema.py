@@ -0,0 +1,49 @@
+"""
+Schema metadata helpers shared by the trigger benchmark and the job runner.
+"""
+
+
+def quote_ident(name):
+    return "`" + name.replace("`", "``") + "`"
+
+
+def foreign_keys(cursor, schema):
+    # -> [{"table", "columns", "ref_table", "ref_columns", "delete_rule"}, ...], one per constraint
+    cursor.execute("""
+        SELECT k.CONSTRAINT_NAME, k.TABLE_NAME, k.COLUMN_NAME,
+               k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME, r.DELETE_RULE
+        FROM information_schema.key_column_usage k
+        JOIN information_schema.referential_constraints r
+          ON r.constraint_schema = k.table_schema
+         AND r.constraint_name = k.constraint_name
+         AND r.table_name = k.table_name
+        WHERE k.table_schema = %s AND k.referenced_table_schema = %s
+        ORDER BY k.TABLE_NAME, k.CONSTRAINT_NAME, k.ORDINAL_POSITION
+    """, (schema, schema))
+    fks = {}
+    for r in cursor.fetchall():
+        key = (r["TABLE_NAME"], r["CONSTRAINT_NAME"])
+        fk = fks.setdefault(key, {
+            "table": r["TABLE_NAME"],
+            "columns": [],
+            "ref_table": r["REFERENCED_TABLE_NAME"],
+            "ref_columns": [],
+            "delete_rule": r["DELETE_RULE"],
+        })
+        fk["columns"].append(r["COLUMN_NAME"])
+        fk["ref_columns"].append(r["REFERENCED_COLUMN_NAME"])
+    return list(fks.values())
+
+
+def primary_keys(cursor, schema):
+    # -> {table: [primary key columns in order]}
+    cursor.execute("""
+        SELECT TABLE_NAME, COLUMN_NAME
+        FROM information_schema.key_column_usage
+        WHERE table_schema = %s AND constraint_name = 'PRIMARY'
+        ORDER BY TABLE_NAME, ORDINAL_POSITION
+    """, (schema,))
+    keys = {}
+    for r in cursor.fetchall():
+        keys.setdefault(r["TABLE_NAME"], []).append(r["COLUMN_NAME"])
+    return keys
@@ -0,0 +1,458 @@
+"""
+Local background job runner for heavy mutations.
+
+Jobs are persisted in the `jobs` table and picked up by worker threads.
+A delete job follows the ON DELETE CASCADE foreign keys pointing at the
+target row and removes dependent rows bottom-up in chunks of `chunk_size`,
+committing after each chunk, so no single transaction holds row locks for
+long. SET NULL children are updated in chunks the same way. RESTRICT /
+NO ACTION references are checked over the whole cascade tree before
+anything is deleted, so a blocked delete fails with the target untouched.
+
+Keys are resolved level by level with separate SELECTs and each DELETE or
+UPDATE names its rows as a literal IN list. A statement never reads another
+table, so triggers on the child (e.g. the playlist recount on
+`playlistsongs`) may freely write to the parent.
+
+Each claimed job records its runner as `owner`, and the runner refreshes
+`heartbeat_at` while it works. Only jobs whose heartbeat is older than
+`STALE_AFTER` seconds are requeued, so a job is never picked up by a second
+runner while its first one is alive.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+
+from db_connection import get_connection
+from db_schema import foreign_keys, primary_keys, quote_ident as _q
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+HEARTBEAT_INTERVAL = 10
+STALE_AFTER = 60
+
+JOBS_DDL = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        jobId INT AUTO_INCREMENT PRIMARY KEY,
+        kind VARCHAR(32) NOT NULL,
+        target VARCHAR(64) NOT NULL,
+        status ENUM('queued', 'running', 'done', 'failed') NOT NULL DEFAULT 'queued',
+        rows_total INT NOT NULL DEFAULT 0,
+        rows_done INT NOT NULL DEFAULT 0,
+        step VARCHAR(128),
+        error TEXT,
+        owner VARCHAR(255) NULL,
+        heartbeat_at TIMESTAMP NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP NULL,
+        finished_at TIMESTAMP NULL,
+        KEY idx_jobs_status (status, jobId)
+    )
+"""
+
+# Added to `jobs` tables created before runners had owners
+OWNER_COLUMNS = {
+    "owner": "VARCHAR(255) NULL",
+    "heartbeat_at": "TIMESTAMP NULL",
+}
+
+# job kind -> (table, primary key column) of the row being deleted
+JOB_KINDS = {
+    "delete_user": ("users", "userId"),
+    "delete_song": ("songs", "songId"),
+}
+
+
+def _cols(columns):
+    quoted = ", ".join(_q(c) for c in columns)
+    return f"({quoted})" if len(columns) > 1 else quoted
+
+
+def _in(columns, keys):
+    # "<cols> IN (...)" over literal key tuples, with its flattened parameters
+    row = "(" + ", ".join(["%s"] * len(columns)) + ")" if len(columns) > 1 else "%s"
+    sql = f"{_cols(columns)} IN ({', '.join([row] * len(keys))})"
+    return sql, [v for key in keys for v in key]
+
+
+def cascade_tree(fks, table, stack=None):
+    """
+    Return [(fk, subtree)] for every foreign key referencing `table`.
+    Only CASCADE edges are followed further; SET NULL and RESTRICT /
+    NO ACTION edges are leaves handled by the runner.
+    """
+    stack = (stack or set()) | {table}
+    tree = []
+    for fk in fks:
+        if fk["ref_table"] == table and fk["table"] not in stack:
+            sub = cascade_tree(fks, fk["table"], stack) if fk["delete_rule"] == "CASCADE" else []
+            tree.append((fk, sub))
+    return tree
+
+
+def _count(cursor, table, where, params, tree):
+    # Read-only estimate of the rows a delete will remove, for progress
+    cursor.execute(f"SELECT COUNT(*) AS n FROM {_q(table)} WHERE {where}", params)
+    total = cursor.fetchone()["n"]
+    for fk, sub in tree:
+        if fk["delete_rule"] == "CASCADE":
+            child_where = (
+                f"{_cols(fk['columns'])} IN "
+                f"(SELECT {_cols(fk['ref_columns'])} FROM {_q(table)} WHERE {where})"
+            )
+            total += _count(cursor, fk["table"], child_where, params, sub)
+    return total
+
+
+def _check_restrict(cursor, table, where, params, tree):
+    # Read-only: raise if a RESTRICT / NO ACTION reference would block the delete
+    for fk, sub in tree:
+        child_where = (
+            f"{_cols(fk['columns'])} IN "
+            f"(SELECT {_cols(fk['ref_columns'])} FROM {_q(table)} WHERE {where})"
+        )
+        if fk["delete_rule"] == "CASCADE":
+            _check_restrict(cursor, fk["table"], child_where, params, sub)
+        elif fk["delete_rule"] != "SET NULL":
+            cursor.execute(f"SELECT 1 FROM {_q(fk['table'])} WHERE {child_where} LIMIT 1", params)
+            if cursor.fetchone():
+                raise RuntimeError(
+                    f"Cannot delete from `{table}`: rows in `{fk['table']}` still reference it "
+                    f"(ON DELETE {fk['delete_rule']})."
+                )
+
+
+def _requeue_stale(cursor):
+    # Jobs interrupted by a crash or restart are safe to resume: deletes are idempotent.
+    cursor.execute("""
+        UPDATE jobs SET status = 'queued', owner = NULL
+        WHERE status = 'running'
+          AND (heartbeat_at IS NULL OR heartbeat_at < NOW() - INTERVAL %s SECOND)
+    """, (STALE_AFTER,))
+
+
+def _close(conn, cursor):
+    try:
+        cursor.close()
+        conn.close()
+    except Exception:
+        pass
+
+
+def init_jobs_table():
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(JOBS_DDL)
+        cursor.execute("""
+            SELECT COLUMN_NAME
+            FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = 'jobs'
+        """)
+        existing = {r[0] for r in cursor.fetchall()}
+        missing = [f"ADD COLUMN {column} {definition}" for column, definition in OWNER_COLUMNS.items() if column not in existing]
+        if missing:
+            cursor.execute(f"ALTER TABLE jobs {', '.join(missing)}")
+        _requeue_stale(cursor)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def enqueue(kind, target):
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT jobId FROM jobs
+            WHERE kind = %s AND target = %s AND status IN ('queued', 'running')
+        """, (kind, str(target)))
+        existing = cursor.fetchone()
+        if existing:
+            return existing["jobId"]
+        cursor.execute("INSERT INTO jobs (kind, target) VALUES (%s, %s)", (kind, str(target)))
+        conn.commit()
+        return cursor.lastrowid
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def recent_jobs(limit=50):
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT jobId, kind, target, status, rows_done, rows_total, step, error,
+                   owner, created_at, started_at, finished_at
+            FROM jobs
+            ORDER BY jobId DESC
+            LIMIT %s
+        """, (int(limit),))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+class JobRunner:
+    def __init__(self, workers=DEFAULT_WORKERS, chunk_size=500, pause=0.05, poll_interval=1.0, on_done=None):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.poll_interval = poll_interval
+        # Called with the job row after a job finishes successfully
+        self.on_done = on_done
+        # host:pid:runner, recorded on every job this runner claims
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        init_jobs_table()
+        targets = [(self._work, f"job-worker-{i}") for i in range(self.workers)]
+        targets.append((self._heartbeat, "job-heartbeat"))
+        for target, name in targets:
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        """
+        Stop the workers at their next chunk boundary and hand any job they
+        were running back to the queue.
+        """
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+        try:
+            conn = get_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    UPDATE jobs SET status = 'queued', owner = NULL
+                    WHERE status = 'running' AND owner = %s
+                """, (self.owner,))
+                conn.commit()
+            finally:
+                cursor.close()
+                conn.close()
+        except Exception:
+            # Left running, they are requeued once their heartbeat goes stale
+            logger.exception("Could not requeue jobs of stopped runner %s", self.owner)
+
+    def _claim(self, conn, cursor):
+        cursor.execute("SELECT jobId, kind, target FROM jobs WHERE status = 'queued' ORDER BY jobId LIMIT 1")
+        job = cursor.fetchone()
+        conn.commit()
+        if not job:
+            return None
+        cursor.execute("""
+            UPDATE jobs SET status = 'running', owner = %s, heartbeat_at = NOW(),
+                            started_at = NOW(), error = NULL
+            WHERE jobId = %s AND status = 'queued'
+        """, (self.owner, job["jobId"]))
+        conn.commit()
+        # Another worker may have claimed it between the SELECT and the UPDATE.
+        return job if cursor.rowcount == 1 else None
+
+    def _work(self):
+        # One connection per worker, replaced only after an error
+        conn = cursor = None
+        while not self._stop.is_set():
+            job = None
+            try:
+                if conn is None:
+                    conn = get_connection()
+                    cursor = conn.cursor(dictionary=True)
+                job = self._claim(conn, cursor)
+                if job:
+                    self._run(conn, cursor, job)
+            except Exception as e:
+                logger.exception("Job worker failed")
+                if job:
+                    self._record_failure(job["jobId"], e)
+                if conn is not None:
+                    _close(conn, cursor)
+                conn = cursor = None
+            if not job:
+                self._stop.wait(self.poll_interval)
+        if conn is not None:
+            _close(conn, cursor)
+
+    def _heartbeat(self):
+        conn = cursor = None
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                if conn is None:
+                    conn = get_connection()
+                    cursor = conn.cursor()
+                cursor.execute("""
+                    UPDATE jobs SET heartbeat_at = NOW()
+                    WHERE status = 'running' AND owner = %s
+                """, (self.owner,))
+                # Pick up jobs left behind by runners that died
+                _requeue_stale(cursor)
+                conn.commit()
+            except Exception:
+                logger.exception("Job heartbeat failed")
+                if conn is not None:
+                    _close(conn, cursor)
+                conn = cursor = None
+        if conn is not None:
+            _close(conn, cursor)
+
+    def _progress(self, conn, cursor, job_id, **fields):
+        # Writes from a runner that lost the job (requeued as stale) are dropped
+        assignments = ", ".join(f"{name} = %s" for name in fields)
+        cursor.execute(
+            f"UPDATE jobs SET {assignments} WHERE jobId = %s AND owner = %s",
+            (*fields.values(), job_id, self.owner)
+        )
+        conn.commit()
+
+    def _finish(self, conn, cursor, job_id, status, error=None):
+        cursor.execute("""
+            UPDATE jobs SET status = %s, error = %s, step = NULL, finished_at = NOW()
+            WHERE jobId = %s AND owner = %s
+        """, (status, error, job_id, self.owner))
+        conn.commit()
+
+    def _record_failure(self, job_id, error):
+        # Fresh connection: the worker's own one may be what broke
+        try:
+            conn = get_connection()
+            cursor = conn.cursor()
+            try:
+                self._finish(conn, cursor, job_id, "failed", str(error))
+            finally:
+                cursor.close()
+                conn.close()
+        except Exception:
+            logger.exception("Could not record failure of job %s", job_id)
+
+    def _delete(self, conn, cursor, job_id, table, columns, keys, tree, pks, progress):
+        """
+        Delete the rows of `table` whose `columns` match `keys`, dependents
+        first. Returns False if the runner was stopped part way.
+        """
+        pk = pks.get(table) or columns
+        for i in range(0, len(keys), self.chunk_size):
+            match_sql, match_params = _in(columns, keys[i:i + self.chunk_size])
+            while not self._stop.is_set():
+                cursor.execute(
+                    f"SELECT {', '.join(_q(c) for c in pk)} FROM {_q(table)} WHERE {match_sql} LIMIT {int(self.chunk_size)}",
+                    match_params
+                )
+                rows = [tuple(r[c] for c in pk) for r in cursor.fetchall()]
+                conn.commit()
+                if not rows:
+                    break
+                rows_sql, rows_params = _in(pk, rows)
+
+                for fk, sub in tree:
+                    cursor.execute(
+                        f"SELECT DISTINCT {', '.join(_q(c) for c in fk['ref_columns'])} FROM {_q(table)} WHERE {rows_sql}",
+                        rows_params
+                    )
+                    parent_keys = [tuple(r[c] for c in fk["ref_columns"]) for r in cursor.fetchall()]
+                    conn.commit()
+                    if not parent_keys:
+                        continue
+                    rule = fk["delete_rule"]
+                    if rule == "CASCADE":
+                        if not self._delete(conn, cursor, job_id, fk["table"], fk["columns"], parent_keys, sub, pks, progress):
+                            return False
+                    elif rule == "SET NULL":
+                        self._set_null(conn, cursor, job_id, fk, parent_keys)
+                    else:
+                        # Checked up front in _run; this catches references added since
+                        child_sql, child_params = _in(fk["columns"], parent_keys)
+                        cursor.execute(f"SELECT 1 FROM {_q(fk['table'])} WHERE {child_sql} LIMIT 1", child_params)
+                        blocked = cursor.fetchone()
+                        conn.commit()
+                        if blocked:
+                            raise RuntimeError(
+                                f"Cannot delete from `{table}`: rows in `{fk['table']}` still reference it "
+                                f"(ON DELETE {rule})."
+                            )
+
+                self._progress(conn, cursor, job_id, step=f"deleting from {table}")
+                cursor.execute(f"DELETE FROM {_q(table)} WHERE {rows_sql}", rows_params)
+                progress["done"] += cursor.rowcount
+                conn.commit()
+                self._progress(conn, cursor, job_id, rows_done=progress["done"])
+                # Let interactive writers in between chunks.
+                time.sleep(self.pause)
+        return not self._stop.is_set()
+
+    def _set_null(self, conn, cursor, job_id, fk, parent_keys):
+        assignments = ", ".join(f"{_q(c)} = NULL" for c in fk["columns"])
+        self._progress(conn, cursor, job_id, step=f"clearing references in {fk['table']}")
+        for i in range(0, len(parent_keys), self.chunk_size):
+            match_sql, match_params = _in(fk["columns"], parent_keys[i:i + self.chunk_size])
+            while True:
+                cursor.execute(
+                    f"UPDATE {_q(fk['table'])} SET {assignments} WHERE {match_sql} LIMIT {int(self.chunk_size)}",
+                    match_params
+                )
+                updated = cursor.rowcount
+                conn.commit()
+                if updated < self.chunk_size:
+                    break
+                time.sleep(self.pause)
+
+    def _run(self, conn, cursor, job):
+        job_id = job["jobId"]
+        table, key = JOB_KINDS[job["kind"]]
+        target = job["target"]
+        try:
+            schema = os.getenv("DB_NAME")
+            tree = cascade_tree(foreign_keys(cursor, schema), table)
+            pks = primary_keys(cursor, schema)
+            where = f"{_q(key)} = %s"
+            _check_restrict(cursor, table, where, (target,), tree)
+            total = _count(cursor, table, where, (target,), tree)
+            conn.commit()
+            self._progress(conn, cursor, job_id, rows_total=total, rows_done=0)
+
+            progress = {"done": 0}
+            if not self._delete(conn, cursor, job_id, table, [key], [(target,)], tree, pks, progress):
+                # Stopped: stop() hands the job back to the queue.
+                return
+
+            self._finish(conn, cursor, job_id, "done")
+        except Exception as e:
+            conn.rollback()
+            self._finish(conn, cursor, job_id, "failed", str(e))
+            return
+        if self.on_done:
+            try:
+                self.on_done(job)
+            except Exception:
+                logger.exception("on_done hook failed for job %s", job_id)
+
+
+_active_runner = None
+_active_lock = threading.Lock()
+
+
+def start_runner(**options):
+    """
+    Start this process's JobRunner, stopping the previous one first.
+    Streamlit's "Clear cache" rebuilds cached resources while the old
+    runner's threads keep running, so the runner is tracked here instead.
+    """
+    global _active_runner
+    with _active_lock:
+        if _active_runner is not None:
+            _active_runner.stop()
+        _active_runner = JobRunner(**options)
+        _active_runner.start()
+        return _active_runner
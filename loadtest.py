@@ -0,0 +1,456 @@
+"""
+Multi-session load test against the configured MySQL database.
+
+Each simulated session is a thread that clicks through menu paths of the
+Streamlit app, running the same read queries and opening the same number
+of connections per page as a script rerun of app.py does. Writes (adding
+or deleting rows, creating triggers) are not replayed.
+
+    python loadtest.py --sessions 20 --duration 60 --out report.json
+
+The report covers throughput, per-page latency percentiles, client-side
+open connections and server-side Threads_connected / Threads_running over
+time, and a worker sizing estimate against max_connections.
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from db_connection import get_connection
+from jobs import DEFAULT_WORKERS
+from metrics import percentile
+from playlist_tracks import fetch_track_page
+from song_media import SearchCache, search_songs
+
+# Shared by all sessions, like the app's per-process search cache
+search_cache = SearchCache()
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.open_connections = 0
+        self.peak_connections = 0
+        self.connections_opened = 0
+        self.latencies = {}
+        self.error_latencies = {}
+        self.errors = {}
+        self.timeline = []
+
+    @contextmanager
+    def connection(self):
+        conn = get_connection()
+        with self.lock:
+            self.open_connections += 1
+            self.connections_opened += 1
+            self.peak_connections = max(self.peak_connections, self.open_connections)
+        try:
+            yield conn
+        finally:
+            conn.close()
+            with self.lock:
+                self.open_connections -= 1
+
+    def record(self, page, seconds, error=None):
+        # Failed page views are kept apart so they don't skew the success percentiles
+        with self.lock:
+            if error:
+                self.error_latencies.setdefault(page, []).append(seconds * 1000)
+                key = f"{page}: {type(error).__name__}: {error}"[:200]
+                self.errors[key] = self.errors.get(key, 0) + 1
+            else:
+                self.latencies.setdefault(page, []).append(seconds * 1000)
+
+
+# -------------------------
+# Pages, mirroring app.py. Every rerun opens the top-level connection first.
+# -------------------------
+def page_view_tables(stats, data, rng):
+    with stats.connection() as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(f"SELECT * FROM {rng.choice(['users', 'songs', 'albums', 'artists', 'playlists'])}")
+        cur.fetchall()
+
+
+def page_search_songs(stats, data, rng):
+    # Playing a result is served from the cached row
+    with stats.connection() as conn:
+        cur = conn.cursor(dictionary=True)
+        title = rng.choice(data["titles"])
+        search_songs(cur, search_cache, title[:4])
+
+
+def page_view_playlists(stats, data, rng):
+    with stats.connection() as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("""
+            SELECT p.playlistId, p.name, p.status, p.tracks, p.total_duration, u.firstName AS owner
+            FROM playlists p
+            JOIN users u ON p.userId = u.userId
+        """)
+        cur.fetchall()
+
+
+def page_user_playlists(stats, data, rng):
+    with stats.connection(), stats.connection() as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SELECT userId, firstName, lastName FROM users ORDER BY userId")
+        cur.fetchall()
+        cur.execute("""
+            SELECT p.playlistId, p.name, p.status, p.tracks, p.total_duration
+            FROM playlists p
+            WHERE p.userId = %s
+        """, (rng.choice(data["users"]),))
+        cur.fetchall()
+
+
+def page_view_songs_in_playlist(stats, data, rng):
+    with stats.connection(), stats.connection() as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("""
+            SELECT p.playlistId, p.name, p.status, u.firstName AS owner
+            FROM playlists p
+            JOIN users u ON p.userId = u.userId
+            ORDER BY p.name
+        """)
+        cur.fetchall()
+        fetch_track_page(cur, rng.choice(data["playlists"]))
+
+
+def page_view_triggers(stats, data, rng):
+    with stats.connection(), stats.connection() as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("""
+            SELECT TRIGGER_NAME, EVENT_MANIPULATION, EVENT_OBJECT_TABLE, ACTION_TIMING, ACTION_STATEMENT, DEFINER
+            FROM information_schema.triggers
+            WHERE trigger_schema = %s
+        """, (os.getenv("DB_NAME"),))
+        cur.fetchall()
+        cur.execute("""
+            SELECT ROUTINE_NAME, ROUTINE_TYPE, CREATED, LAST_ALTERED, DEFINER, ROUTINE_DEFINITION
+            FROM information_schema.routines
+            WHERE ROUTINE_SCHEMA = %s
+        """, (os.getenv("DB_NAME"),))
+        cur.fetchall()
+
+
+def page_manage_songs(stats, data, rng):
+    with stats.connection(), stats.connection() as conn:
+        cur = conn.cursor(dictionary=True)
+        title = rng.choice(data["titles"])
+        cur.execute("SELECT songId, title, releaseDate, duration FROM songs WHERE title LIKE %s", (f"%{title[:4]}%",))
+        results = cur.fetchall()
+        if results:
+            cur.execute("""
+                SELECT p.playlistId, p.name, p.status, u.firstName AS owner
+                FROM playlistsongs ps
+                JOIN playlists p ON ps.playlistId = p.playlistId
+                JOIN users u ON p.userId = u.userId
+                WHERE ps.songId = %s
+            """, (results[0]["songId"],))
+            cur.fetchall()
+            cur.execute("SELECT playlistId, name FROM playlists ORDER BY name")
+            cur.fetchall()
+
+
+def page_edit_song(stats, data, rng):
+    with stats.connection(), stats.connection() as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SELECT songId, title FROM songs ORDER BY songId")
+        cur.fetchall()
+        cur.execute("SELECT * FROM songs WHERE songId = %s", (rng.choice(data["songs"]),))
+        cur.fetchall()
+
+
+def page_add_song(stats, data, rng):
+    # Only the delete list renders until "Add Song" is clicked
+    with stats.connection(), stats.connection() as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SELECT songId, title FROM songs ORDER BY songId")
+        cur.fetchall()
+
+
+def page_add_user(stats, data, rng):
+    with stats.connection(), stats.connection() as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SELECT userId, firstName, lastName FROM users ORDER BY userId")
+        cur.fetchall()
+
+
+def page_background_jobs(stats, data, rng):
+    with stats.connection(), stats.connection() as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("""
+            SELECT jobId, kind, target, status, rows_done, rows_total, step, error,
+                   owner, created_at, started_at, finished_at
+            FROM jobs
+            ORDER BY jobId DESC
+            LIMIT 50
+        """)
+        cur.fetchall()
+
+
+def page_add_trigger(stats, data, rng):
+    # Table list, write-cost list, drop list and trigger list each open their own connection
+    with stats.connection():
+        with stats.connection() as conn:
+            cur = conn.cursor(dictionary=True)
+            cur.execute("""
+                SELECT table_name FROM information_schema.tables
+                WHERE table_schema = %s ORDER BY table_name
+            """, (os.getenv("DB_NAME"),))
+            cur.fetchall()
+        for _ in range(3):
+            with stats.connection() as conn:
+                cur = conn.cursor(dictionary=True)
+                cur.execute("""
+                    SELECT TRIGGER_NAME, EVENT_MANIPULATION, EVENT_OBJECT_TABLE, ACTION_TIMING, ACTION_STATEMENT
+                    FROM information_schema.triggers
+                    WHERE trigger_schema = %s
+                """, (os.getenv("DB_NAME"),))
+                cur.fetchall()
+
+
+PAGES = {
+    "View Tables": page_view_tables,
+    "Add Song": page_add_song,
+    "Edit Song": page_edit_song,
+    "Search Songs": page_search_songs,
+    "View Playlists": page_view_playlists,
+    "User Playlists": page_user_playlists,
+    "View Songs in Playlist": page_view_songs_in_playlist,
+    "View Triggers & Procedures": page_view_triggers,
+    "Manage Songs in Playlists": page_manage_songs,
+    "Add Trigger": page_add_trigger,
+    "Add User": page_add_user,
+    "Background Jobs": page_background_jobs,
+}
+
+# (weight, clicks) — a session repeatedly picks a path and walks it
+PATHS = [
+    (40, ["Search Songs", "Search Songs", "Search Songs"]),
+    (25, ["View Playlists", "View Songs in Playlist", "View Songs in Playlist"]),
+    (15, ["User Playlists", "View Songs in Playlist"]),
+    (10, ["Search Songs", "Manage Songs in Playlists"]),
+    (5, ["Edit Song", "Add Song", "View Tables"]),
+    (4, ["View Triggers & Procedures", "Add Trigger"]),
+    (1, ["Add User", "Background Jobs"]),
+]
+
+
+def load_sample_data():
+    conn = get_connection()
+    cur = conn.cursor(dictionary=True)
+    try:
+        data = {}
+        cur.execute("SELECT songId, title FROM songs LIMIT 1000")
+        rows = cur.fetchall()
+        data["songs"] = [r["songId"] for r in rows]
+        data["titles"] = [r["title"] for r in rows if r["title"]]
+        cur.execute("SELECT userId FROM users LIMIT 1000")
+        data["users"] = [r["userId"] for r in cur.fetchall()]
+        cur.execute("SELECT playlistId FROM playlists LIMIT 1000")
+        data["playlists"] = [r["playlistId"] for r in cur.fetchall()]
+        if not all(data.values()):
+            raise SystemExit("Need at least one song, user and playlist to run the load test.")
+        return data
+    finally:
+        cur.close()
+        conn.close()
+
+
+def session(stats, data, deadline, think, rng_seed):
+    rng = random.Random(rng_seed)
+    weights = [w for w, _ in PATHS]
+    while time.time() < deadline:
+        clicks = rng.choices([p for _, p in PATHS], weights)[0]
+        for page in clicks:
+            if time.time() >= deadline:
+                return
+            start = time.perf_counter()
+            try:
+                PAGES[page](stats, data, rng)
+                stats.record(page, time.perf_counter() - start)
+            except Exception as e:
+                stats.record(page, time.perf_counter() - start, e)
+            time.sleep(rng.uniform(0, think))
+
+
+def _server_status(cur):
+    cur.execute("SHOW GLOBAL STATUS WHERE Variable_name IN ('Threads_connected', 'Threads_running', 'Max_used_connections')")
+    return {r["Variable_name"]: int(r["Value"]) for r in cur.fetchall()}
+
+
+def measure_baseline():
+    # Server connections before the test, not counting this probe
+    conn = get_connection()
+    cur = conn.cursor(dictionary=True)
+    try:
+        return _server_status(cur)["Threads_connected"] - 1
+    finally:
+        cur.close()
+        conn.close()
+
+
+def monitor(stats, deadline, interval):
+    # Uses one extra connection, not counted in the client-side totals
+    conn = get_connection()
+    cur = conn.cursor(dictionary=True)
+    started = time.time()
+    try:
+        while time.time() < deadline:
+            status = _server_status(cur)
+            with stats.lock:
+                stats.timeline.append({
+                    "t": round(time.time() - started, 2),
+                    "client_open": stats.open_connections,
+                    "threads_connected": status.get("Threads_connected"),
+                    "threads_running": status.get("Threads_running"),
+                })
+            time.sleep(interval)
+    finally:
+        cur.close()
+        conn.close()
+
+
+def build_report(stats, args, elapsed, server, baseline):
+    pages = {}
+    for page in sorted(set(stats.latencies) | set(stats.error_latencies)):
+        values = stats.latencies.get(page, [])
+        failed = stats.error_latencies.get(page, [])
+        pages[page] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "max_ms": round(max(values, default=0), 2),
+            "errors": len(failed),
+            "error_p95_ms": round(percentile(failed, 95), 2),
+        }
+    all_latencies = [v for values in stats.latencies.values() for v in values]
+    all_failed = [v for values in stats.error_latencies.values() for v in values]
+    total = len(all_latencies)
+    peak_server = max((s["threads_connected"] or 0 for s in stats.timeline), default=0)
+    per_session = stats.peak_connections / args.sessions
+
+    # Connections not available to sessions: whatever was connected before the
+    # test started (other clients, a running app's workers) plus the job
+    # workers (plus the runner's heartbeat connection) every additional app
+    # process brings with it.
+    per_process = args.job_workers + 1 if args.job_workers else 0
+    reserved = baseline + per_process * args.app_processes
+    available = (server.get("max_connections") or 0) - reserved
+    return {
+        "sessions": args.sessions,
+        "duration_s": round(elapsed, 2),
+        "page_views": total,
+        "throughput_per_s": round(total / elapsed, 2) if elapsed else 0,
+        "errors": len(all_failed),
+        "latency": {
+            "p50_ms": round(percentile(all_latencies, 50), 2),
+            "p95_ms": round(percentile(all_latencies, 95), 2),
+            "p99_ms": round(percentile(all_latencies, 99), 2),
+        },
+        "error_latency": {
+            "p50_ms": round(percentile(all_failed, 50), 2),
+            "p95_ms": round(percentile(all_failed, 95), 2),
+        },
+        "pages": pages,
+        "connections": {
+            "opened": stats.connections_opened,
+            "client_peak_open": stats.peak_connections,
+            "peak_per_session": round(per_session, 2),
+            "server_peak_threads_connected": peak_server,
+            "server_peak_threads_running": max((s["threads_running"] or 0 for s in stats.timeline), default=0),
+            "server_max_used_connections": server.get("Max_used_connections"),
+            "server_max_connections": server.get("max_connections"),
+            "baseline_threads_connected": baseline,
+            "reserved_for_job_workers": per_process * args.app_processes,
+            "available_for_sessions": available,
+        },
+        # Sessions that fit in what is left of max_connections at this click rate
+        "estimated_max_sessions": max(0, int(available / per_session)) if per_session and server.get("max_connections") else None,
+        "error_samples": dict(sorted(stats.errors.items(), key=lambda kv: -kv[1])[:10]),
+        "timeline": stats.timeline,
+    }
+
+
+def print_summary(report):
+    c = report["connections"]
+    print(f"Sessions: {report['sessions']}  Duration: {report['duration_s']}s  "
+          f"Page views: {report['page_views']}  Throughput: {report['throughput_per_s']}/s  Errors: {report['errors']}")
+    print(f"Latency p50/p95/p99: {report['latency']['p50_ms']} / {report['latency']['p95_ms']} / {report['latency']['p99_ms']} ms")
+    if report["errors"]:
+        print(f"Failed page views p50/p95: {report['error_latency']['p50_ms']} / {report['error_latency']['p95_ms']} ms")
+    print(f"{'Page':<28}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'errors':>8}")
+    for page, p in report["pages"].items():
+        print(f"{page:<28}{p['count']:>8}{p['p50_ms']:>10}{p['p95_ms']:>10}{p['p99_ms']:>10}{p['errors']:>8}")
+    print(f"Connections opened: {c['opened']}  client peak open: {c['client_peak_open']} "
+          f"({c['peak_per_session']} per session)")
+    print(f"Server peak Threads_connected: {c['server_peak_threads_connected']}  "
+          f"Threads_running: {c['server_peak_threads_running']}  "
+          f"Max_used_connections: {c['server_max_used_connections']} / max_connections: {c['server_max_connections']}")
+    print(f"Baseline connections: {c['baseline_threads_connected']}  reserved for job workers: "
+          f"{c['reserved_for_job_workers']}  available for sessions: {c['available_for_sessions']}")
+    if report["estimated_max_sessions"] is not None:
+        print(f"Estimated concurrent sessions before max_connections: {report['estimated_max_sessions']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent app sessions against MySQL.")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent simulated sessions")
+    parser.add_argument("--duration", type=float, default=30, help="test length in seconds")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which sessions start")
+    parser.add_argument("--think", type=float, default=1.0, help="max think time between clicks, seconds")
+    parser.add_argument("--interval", type=float, default=0.5, help="connection sampling interval, seconds")
+    parser.add_argument("--app-processes", type=int, default=1, help="app server processes the estimate is for")
+    parser.add_argument(
+        "--job-workers", type=int, default=DEFAULT_WORKERS,
+        help="job workers per app process (each runner adds a heartbeat connection); "
+             "use 0 if the app was running (and counted) at baseline"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the full JSON report (with timeline) to this file")
+    args = parser.parse_args()
+
+    data = load_sample_data()
+    baseline = measure_baseline()
+    stats = Stats()
+    started = time.time()
+    deadline = started + args.ramp + args.duration
+
+    threads = [threading.Thread(target=monitor, args=(stats, deadline, args.interval), daemon=True)]
+    threads[0].start()
+    for i in range(args.sessions):
+        t = threading.Thread(target=session, args=(stats, data, deadline, args.think, args.seed + i), daemon=True)
+        t.start()
+        threads.append(t)
+        time.sleep(args.ramp / max(1, args.sessions))
+    for t in threads:
+        t.join()
+    elapsed = time.time() - started
+
+    conn = get_connection()
+    cur = conn.cursor(dictionary=True)
+    try:
+        server = _server_status(cur)
+        cur.execute("SELECT @@max_connections AS max_connections")
+        server["max_connections"] = cur.fetchone()["max_connections"]
+    finally:
+        cur.close()
+        conn.close()
+
+    report = build_report(stats, args, elapsed, server, baseline)
+    print_summary(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+"""
+Small statistics helpers shared by the trigger benchmark and the load test.
+"""
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile; 0.0 for no samples
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
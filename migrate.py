@@ -0,0 +1,37 @@
+"""
+One-off schema migrations for features that need new tables or columns.
+
+    python migrate.py
+
+Every step is safe to run again. Run it before starting the app, outside
+of peak traffic: backfills run as set-based statements or in committed batches.
+"""
+import os
+
+from db_connection import get_connection
+from playlist_tracks import migrate_playlist_tracks
+from song_media import migrate_song_media
+
+MIGRATIONS = [
+    ("playlist track listing", migrate_playlist_tracks),
+    ("song embed metadata", migrate_song_media),
+]
+
+
+def main():
+    schema = os.getenv("DB_NAME")
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        for name, migrate in MIGRATIONS:
+            print(f"Migrating: {name}...")
+            migrate(conn, cursor, schema)
+            conn.commit()
+        print("Done.")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Track listing for a single playlist.
+
+One row per track with its artists aggregated, the playlist's maintained
+totals (`tracks`, `total_duration`) returned in the same query, and keyset
+paging so large playlists are read one page at a time.
+
+Paging reads `playlisttracks`, a listing table kept in step with
+`playlistsongs` (foreign key, ON DELETE/UPDATE CASCADE) and `songs.title`
+(trigger). It is indexed on (playlistId, title, songId) and
+(playlistId, trackSeq), so a page is an index range scan of `page_size`
+rows rather than a sort of the whole playlist. Create it with
+`python migrate.py`.
+"""
+
+# order name -> listing column the page is sorted and keyed on (ties broken by songId).
+# Both columns are NOT NULL, so keyset comparisons never meet a NULL.
+SORT_COLUMNS = {
+    "title": "pt.title",
+    # order rows reached the listing table: tracks added after the migration
+    # follow insertion order, older ones were numbered by songId within each
+    # playlist (playlistsongs has no added-at column to recover it from)
+    "position": "pt.trackSeq",
+}
+
+
+def _column_type(cursor, schema, table, column):
+    cursor.execute("""
+        SELECT COLUMN_TYPE
+        FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = %s AND column_name = %s
+    """, (schema, table, column))
+    return cursor.fetchone()["COLUMN_TYPE"]
+
+
+def migrate_playlist_tracks(conn, cursor, schema):
+    """
+    Create and backfill the `playlisttracks` listing table and its triggers.
+    Safe to run again; run it outside of serving traffic on large databases.
+    """
+    cursor.execute("""
+        SELECT COUNT(*) AS n
+        FROM information_schema.tables
+        WHERE table_schema = %s AND table_name = 'playlisttracks'
+    """, (schema,))
+    if not cursor.fetchone()["n"]:
+        # Key types follow playlistsongs/songs so the foreign key lines up
+        playlist_type = _column_type(cursor, schema, "playlistsongs", "playlistId")
+        song_type = _column_type(cursor, schema, "playlistsongs", "songId")
+        title_type = _column_type(cursor, schema, "songs", "title")
+        cursor.execute(f"""
+            CREATE TABLE playlisttracks (
+                trackSeq BIGINT NOT NULL AUTO_INCREMENT,
+                playlistId {playlist_type} NOT NULL,
+                songId {song_type} NOT NULL,
+                title {title_type} NOT NULL DEFAULT '',
+                PRIMARY KEY (playlistId, songId),
+                UNIQUE KEY uq_playlisttracks_seq (trackSeq),
+                KEY idx_playlisttracks_title (playlistId, title, songId),
+                KEY idx_playlisttracks_position (playlistId, trackSeq),
+                CONSTRAINT fk_playlisttracks_playlistsongs FOREIGN KEY (playlistId, songId)
+                    REFERENCES playlistsongs (playlistId, songId)
+                    ON DELETE CASCADE ON UPDATE CASCADE
+            )
+        """)
+
+    # New playlist entries; cascaded deletes/key updates are handled by the FK
+    cursor.execute("DROP TRIGGER IF EXISTS after_playlistsongs_insert_playlisttracks")
+    cursor.execute("""
+        CREATE TRIGGER after_playlistsongs_insert_playlisttracks
+        AFTER INSERT ON playlistsongs
+        FOR EACH ROW
+        INSERT IGNORE INTO playlisttracks (playlistId, songId, title)
+        SELECT NEW.playlistId, NEW.songId, COALESCE(s.title, '')
+        FROM songs s WHERE s.songId = NEW.songId
+    """)
+    cursor.execute("DROP TRIGGER IF EXISTS after_songs_update_playlisttracks")
+    cursor.execute("""
+        CREATE TRIGGER after_songs_update_playlisttracks
+        AFTER UPDATE ON songs
+        FOR EACH ROW
+        UPDATE playlisttracks SET title = COALESCE(NEW.title, '')
+        WHERE songId = NEW.songId AND NOT (NEW.title <=> OLD.title)
+    """)
+
+    # Existing rows get positions in (playlistId, songId) order: there is no
+    # record of when they were added
+    cursor.execute("""
+        INSERT IGNORE INTO playlisttracks (playlistId, songId, title)
+        SELECT ps.playlistId, ps.songId, COALESCE(s.title, '')
+        FROM playlistsongs ps
+        JOIN songs s ON ps.songId = s.songId
+        ORDER BY ps.playlistId, ps.songId
+    """)
+
+
+def fetch_track_page(cursor, playlist_id, order="title", after=None, page_size=50):
+    """
+    Return (tracks, totals, has_more) for one page of a playlist.
+
+    `after` is the (sort value, songId) pair of the last track on the
+    previous page, or None for the first page. `totals` holds the playlist's
+    name, tracks and total_duration and is returned even when the page is
+    empty; it is None only if the playlist does not exist.
+    """
+    sort_col = SORT_COLUMNS[order]
+    keyset = ""
+    params = []
+    if after is not None:
+        keyset = f"AND ({sort_col} > %s OR ({sort_col} = %s AND pt.songId > %s))"
+        params = [after[0], after[0], after[1]]
+
+    # The playlist row is the outer side so its totals come back even when
+    # the page has no tracks; artists are aggregated only for the page's rows.
+    # One extra row tells whether another page follows.
+    cursor.execute(f"""
+        SELECT p.name AS playlist_name, p.tracks AS playlist_tracks,
+               p.total_duration AS playlist_duration,
+               s.songId, s.title, s.duration, s.releaseDate, s.song_link,
+               {sort_col} AS sort_key,
+               (SELECT GROUP_CONCAT(a.name ORDER BY a.name SEPARATOR ', ')
+                FROM artistsong ars
+                JOIN artists a ON ars.artistId = a.artistId
+                WHERE ars.songId = s.songId) AS artists
+        FROM playlists p
+        LEFT JOIN (playlisttracks pt JOIN songs s ON pt.songId = s.songId)
+            ON pt.playlistId = p.playlistId {keyset}
+        WHERE p.playlistId = %s
+        ORDER BY {sort_col}, pt.songId
+        LIMIT %s
+    """, (*params, playlist_id, int(page_size) + 1))
+    rows = cursor.fetchall()
+
+    if not rows:
+        return [], None, False
+    totals = {
+        "name": rows[0]["playlist_name"],
+        "tracks": rows[0]["playlist_tracks"],
+        "total_duration": rows[0]["playlist_duration"],
+    }
+    tracks = []
+    for r in rows:
+        if r["songId"] is None:
+            continue
+        tracks.append({
+            "songId": r["songId"],
+            "title": r["title"],
+            "artists": r["artists"],
+            "duration": r["duration"],
+            "releaseDate": r["releaseDate"],
+            "song_link": r["song_link"],
+            "sort_key": r["sort_key"],
+        })
+    has_more = len(tracks) > page_size
+    return tracks[:page_size], totals, has_more
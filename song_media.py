@@ -0,0 +1,147 @@
+"""
+Playable media for songs.
+
+The embed URL and provider of a song are resolved once from `song_link`
+when the song is written and stored in `songs.embed_url` /
+`songs.embed_provider`. Search results are cached per query, keyed by
+songId, so picking a result to play needs no further query.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+MEDIA_COLUMNS = {
+    "embed_provider": "VARCHAR(16) NULL",
+    "embed_url": "VARCHAR(512) NULL",
+}
+
+YOUTUBE_HOSTS = ("youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com", "youtu.be")
+SPOTIFY_TYPES = ("track", "album", "playlist", "episode", "artist")
+
+
+def resolve_embed(link):
+    """
+    Return (provider, embed_url) for a song link. provider is "youtube",
+    "spotify" or "link" (anything else, played as a plain link with no
+    embed_url); both are None when there is no link.
+    """
+    link = (link or "").strip()
+    if not link:
+        return None, None
+    parsed = urlparse(link if "://" in link else "https://" + link)
+    host = parsed.netloc.lower()
+    parts = [p for p in parsed.path.split("/") if p]
+
+    if host in YOUTUBE_HOSTS:
+        video_id = None
+        if host == "youtu.be" and parts:
+            video_id = parts[0]
+        elif parts[:1] == ["watch"] or not parts:
+            video_id = parse_qs(parsed.query).get("v", [None])[0]
+        elif len(parts) >= 2 and parts[0] in ("embed", "shorts", "live", "v"):
+            video_id = parts[1]
+        if video_id and re.fullmatch(r"[A-Za-z0-9_-]+", video_id):
+            return "youtube", f"https://www.youtube.com/embed/{video_id}"
+
+    if host == "spotify.com" or host.endswith(".spotify.com"):
+        # open.spotify.com/[intl-xx/][embed/]track/<id>
+        parts = [p for p in parts if not p.startswith("intl-") and p != "embed"]
+        if len(parts) >= 2 and parts[0] in SPOTIFY_TYPES:
+            return "spotify", f"https://open.spotify.com/embed/{parts[0]}/{parts[1]}"
+
+    return "link", None
+
+
+def migrate_song_media(conn, cursor, schema, batch_size=500):
+    """
+    Add the embed columns and resolve songs written before they existed.
+    Run from migrate.py: resolution happens in Python, so the backfill walks
+    the pending songs in songId order and commits one batch at a time.
+    """
+    cursor.execute("""
+        SELECT COLUMN_NAME
+        FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = 'songs'
+    """, (schema,))
+    existing = {r["COLUMN_NAME"] for r in cursor.fetchall()}
+    missing = [f"ADD COLUMN {column} {definition}" for column, definition in MEDIA_COLUMNS.items() if column not in existing]
+    if missing:
+        cursor.execute(f"ALTER TABLE songs {', '.join(missing)}")
+
+    pending_sql = """
+        SELECT songId, song_link
+        FROM songs
+        WHERE embed_provider IS NULL AND song_link IS NOT NULL AND song_link <> ''
+    """
+    last_id = None
+    while True:
+        if last_id is None:
+            cursor.execute(f"{pending_sql} ORDER BY songId LIMIT {int(batch_size)}")
+        else:
+            cursor.execute(f"{pending_sql} AND songId > %s ORDER BY songId LIMIT {int(batch_size)}", (last_id,))
+        pending = cursor.fetchall()
+        if not pending:
+            break
+        cursor.executemany(
+            "UPDATE songs SET embed_provider = %s, embed_url = %s WHERE songId = %s",
+            [(*resolve_embed(song["song_link"]), song["songId"]) for song in pending]
+        )
+        conn.commit()
+        last_id = pending[-1]["songId"]
+
+
+class SearchCache:
+    """
+    LRU cache of title searches: stripped query -> OrderedDict(songId -> row).
+    The key keeps the query's case, so it is correct whatever the collation
+    of `songs.title` (a case-insensitive collation just caches "abc" and
+    "ABC" separately).
+    Entries also expire after `ttl` seconds to bound staleness from writes
+    made outside the app; writes made through the app call clear().
+    """
+
+    def __init__(self, max_entries=128, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def _key(query):
+        return query.strip()
+
+    def get(self, query):
+        key = self._key(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, results = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return results
+
+    def put(self, query, results):
+        key = self._key(query)
+        with self._lock:
+            self._entries[key] = (time.time(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def search_songs(cursor, cache, query):
+    results = cache.get(query)
+    if results is None:
+        cursor.execute("SELECT * FROM songs WHERE title LIKE %s", (f"%{query.strip()}%",))
+        results = OrderedDict((row["songId"], row) for row in cursor.fetchall())
+        cache.put(query, results)
+    return results
@@ -0,0 +1,341 @@
+"""
+Sandboxed write-cost benchmark for triggers.
+
+The target table (plus every other table of the schema, structure only) is
+cloned into a per-run scratch schema together with a sample of rows, the
+rows they reference and the rows that reference them. Every sampled row is
+then UPDATEd to a different value, DELETEd and re-INSERTed one statement at
+a time under three scenarios: no triggers, the existing triggers, and the
+existing triggers plus the trigger being analysed. Each scenario runs
+inside one transaction that is rolled back, so all scenarios start from
+the same data.
+
+Tables whose columns are all keys (e.g. junction tables) have nothing to
+UPDATE, so only INSERT and DELETE are measured for them.
+"""
+import re
+import time
+
+import mysql.connector
+
+from db_connection import get_connection
+from db_schema import foreign_keys, quote_ident as _q
+from metrics import percentile
+
+OPERATIONS = ["INSERT", "UPDATE", "DELETE"]
+ROW_COUNTERS = ["Handler_write", "Handler_update", "Handler_delete"]
+# ER_SPECIFIC_ACCESS_DENIED_ERROR: innodb_trx needs the PROCESS privilege
+ER_SPECIFIC_ACCESS_DENIED = 1227
+
+
+class BenchmarkSkipped(ValueError):
+    """The benchmark cannot run for this table or trigger; nothing was executed."""
+
+
+def scratch_schema_name(schema, run_id):
+    # Unique per run so concurrent sessions never drop each other's sandbox
+    return f"{schema}_trigger_sandbox_{run_id}"
+
+
+def _status(cursor, names, scope="SESSION"):
+    cursor.execute(f"SHOW {scope} STATUS")
+    values = {}
+    for row in cursor.fetchall():
+        row = list(row.values()) if isinstance(row, dict) else row
+        if row[0] in names:
+            values[row[0]] = int(row[1])
+    return values
+
+
+def _rows_touched(before, after):
+    return sum(after.get(c, 0) - before.get(c, 0) for c in ROW_COUNTERS)
+
+
+def _columns(cursor, schema, table):
+    cursor.execute("""
+        SELECT COLUMN_NAME
+        FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = %s
+        ORDER BY ORDINAL_POSITION
+    """, (schema, table))
+    columns = [r["COLUMN_NAME"] for r in cursor.fetchall()]
+    cursor.execute("""
+        SELECT COLUMN_NAME
+        FROM information_schema.key_column_usage
+        WHERE table_schema = %s AND table_name = %s AND constraint_name = 'PRIMARY'
+        ORDER BY ORDINAL_POSITION
+    """, (schema, table))
+    primary = [r["COLUMN_NAME"] for r in cursor.fetchall()]
+    cursor.execute("""
+        SELECT DISTINCT COLUMN_NAME
+        FROM information_schema.statistics
+        WHERE table_schema = %s AND table_name = %s AND non_unique = 0
+    """, (schema, table))
+    unique = {r["COLUMN_NAME"] for r in cursor.fetchall()}
+    return columns, primary, unique
+
+
+def _update_values(columns, primary, unique, rows):
+    """
+    Pick the column the UPDATE step changes and, for each sampled row, a
+    different value for it taken from another sampled row (so it fits the
+    column type). Unique and key columns are skipped to avoid conflicts.
+    Returns (column, values) or (None, None) when no column has two values.
+    """
+    best = None
+    for col in columns:
+        if col in primary or col in unique:
+            continue
+        distinct = {r[col] for r in rows if r[col] is not None}
+        if len(distinct) > 1 and (best is None or len(distinct) > best[1]):
+            best = (col, len(distinct))
+    if best is None:
+        return None, None
+    col = best[0]
+    pool = [r[col] for r in rows if r[col] is not None]
+    values = []
+    for r in rows:
+        values.append(next(v for v in pool if v != r[col]))
+    return col, values
+
+
+def _trx_rows_locked(cursor):
+    # Row locks held by this session's transaction (0 before it starts)
+    cursor.execute("""
+        SELECT trx_rows_locked
+        FROM information_schema.innodb_trx
+        WHERE trx_mysql_thread_id = CONNECTION_ID()
+    """)
+    row = cursor.fetchone()
+    return row["trx_rows_locked"] if row else 0
+
+
+def _can_read_locks(cursor):
+    try:
+        _trx_rows_locked(cursor)
+    except mysql.connector.Error as e:
+        if e.errno == ER_SPECIFIC_ACCESS_DENIED:
+            return False
+        raise
+    return True
+
+
+def existing_triggers(cursor, schema):
+    cursor.execute("""
+        SELECT TRIGGER_NAME, EVENT_MANIPULATION, EVENT_OBJECT_TABLE,
+               ACTION_TIMING, ACTION_STATEMENT
+        FROM information_schema.triggers
+        WHERE trigger_schema = %s
+        ORDER BY EVENT_OBJECT_TABLE, TRIGGER_NAME
+    """, (schema,))
+    return cursor.fetchall()
+
+
+def references_live_schema(body, schema):
+    # Qualified references would escape the sandbox and hit live data.
+    pattern = r"(`" + re.escape(schema) + r"`|\b" + re.escape(schema) + r")\s*\."
+    return re.search(pattern, body, re.IGNORECASE) is not None
+
+
+def _build_sandbox(cursor, schema, scratch, table, sample_rows):
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    cursor.execute(f"CREATE DATABASE {_q(scratch)}")
+
+    cursor.execute("""
+        SELECT table_name AS TABLE_NAME
+        FROM information_schema.tables
+        WHERE table_schema = %s AND table_type = 'BASE TABLE'
+    """, (schema,))
+    tables = [r["TABLE_NAME"] for r in cursor.fetchall()]
+    # Unqualified names (REFERENCES, trigger bodies) now resolve to the sandbox.
+    cursor.execute(f"USE {_q(scratch)}")
+    for tbl in tables:
+        cursor.execute(f"SHOW CREATE TABLE {_q(schema)}.{_q(tbl)}")
+        ddl = cursor.fetchone()["Create Table"]
+        cursor.execute(ddl)
+
+    cursor.execute(
+        f"INSERT INTO {_q(scratch)}.{_q(table)} SELECT * FROM {_q(schema)}.{_q(table)} LIMIT %s",
+        (int(sample_rows),)
+    )
+
+    fks = foreign_keys(cursor, schema)
+    populated = [table]
+    # Rows referencing the sample (so cascades and recount triggers have work to do)
+    for fk in fks:
+        if fk["ref_table"] == table and fk["table"] != table:
+            on = " AND ".join(f"c.{_q(c)} = p.{_q(rc)}" for c, rc in zip(fk["columns"], fk["ref_columns"]))
+            cursor.execute(
+                f"INSERT IGNORE INTO {_q(scratch)}.{_q(fk['table'])} "
+                f"SELECT c.* FROM {_q(schema)}.{_q(fk['table'])} c "
+                f"JOIN {_q(scratch)}.{_q(table)} p ON {on}"
+            )
+            populated.append(fk["table"])
+    # Rows referenced by anything copied so far (so re-INSERTs pass FK checks)
+    for tbl in populated:
+        for fk in fks:
+            if fk["table"] == tbl and fk["ref_table"] != tbl:
+                on = " AND ".join(f"c.{_q(c)} = p.{_q(rc)}" for c, rc in zip(fk["columns"], fk["ref_columns"]))
+                cursor.execute(
+                    f"INSERT IGNORE INTO {_q(scratch)}.{_q(fk['ref_table'])} "
+                    f"SELECT DISTINCT p.* FROM {_q(schema)}.{_q(fk['ref_table'])} p "
+                    f"JOIN {_q(scratch)}.{_q(tbl)} c ON {on}"
+                )
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+
+def _create_trigger(cursor, trig):
+    sql = (
+        f"CREATE TRIGGER {_q(trig['TRIGGER_NAME'])} "
+        f"{trig['ACTION_TIMING']} {trig['EVENT_MANIPULATION']} ON {_q(trig['EVENT_OBJECT_TABLE'])} "
+        f"FOR EACH ROW {trig['ACTION_STATEMENT']}"
+    )
+    cursor.execute(sql)
+
+
+def _set_triggers(cursor, scratch, triggers):
+    cursor.execute("""
+        SELECT TRIGGER_NAME FROM information_schema.triggers WHERE trigger_schema = %s
+    """, (scratch,))
+    for r in cursor.fetchall():
+        cursor.execute(f"DROP TRIGGER {_q(r['TRIGGER_NAME'])}")
+    for trig in triggers:
+        _create_trigger(cursor, trig)
+
+
+def _run_workload(conn, cursor, table, columns, primary, rows, set_col, new_values, read_locks=True):
+    plain = conn.cursor()
+    where = " AND ".join(f"{_q(c)} = %s" for c in primary)
+    operations = [op for op in OPERATIONS if op != "UPDATE" or set_col is not None]
+    new_values = new_values or [None] * len(rows)
+    statements = {
+        "UPDATE": f"UPDATE {_q(table)} SET {_q(set_col)} = %s WHERE {where}" if set_col else None,
+        "DELETE": f"DELETE FROM {_q(table)} WHERE {where}",
+        "INSERT": (
+            f"INSERT INTO {_q(table)} ({', '.join(_q(c) for c in columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})"
+        ),
+    }
+
+    # Calibrate the cost of reading the counters themselves.
+    a = _status(cursor, ROW_COUNTERS)
+    b = _status(cursor, ROW_COUNTERS)
+    overhead = _rows_touched(a, b)
+
+    latencies = {op: [] for op in operations}
+    touched = {op: 0 for op in operations}
+    locked = {op: 0 for op in operations}
+    # Server-wide counters: they include waits caused by any other traffic.
+    locks_before = _status(cursor, ["Innodb_row_lock_waits", "Innodb_row_lock_time"], "GLOBAL")
+
+    # Close any implicit transaction so the workload gets one of its own.
+    conn.commit()
+    try:
+        for row, new_value in zip(rows, new_values):
+            key = tuple(row[c] for c in primary)
+            values = tuple(row[c] for c in columns)
+            # UPDATE (to a different value) then DELETE then INSERT of the
+            # original row; the rollback below undoes the rest.
+            for op, params in (("UPDATE", (new_value, *key)), ("DELETE", key), ("INSERT", values)):
+                if op not in operations:
+                    continue
+                locks_held = _trx_rows_locked(cursor) if read_locks else 0
+                before = _status(cursor, ROW_COUNTERS)
+                start = time.perf_counter()
+                plain.execute(statements[op], params)
+                latencies[op].append((time.perf_counter() - start) * 1000)
+                after = _status(cursor, ROW_COUNTERS)
+                touched[op] += max(0, _rows_touched(before, after) - overhead)
+                if read_locks:
+                    locked[op] += max(0, _trx_rows_locked(cursor) - locks_held)
+    finally:
+        conn.rollback()
+        plain.close()
+
+    locks_after = _status(cursor, ["Innodb_row_lock_waits", "Innodb_row_lock_time"], "GLOBAL")
+    n = max(1, len(rows))
+    results = []
+    for op in operations:
+        results.append({
+            "operation": op,
+            "avg_ms": round(sum(latencies[op]) / n, 3),
+            "p95_ms": round(percentile(latencies[op], 95), 3),
+            "rows_touched_per_row": round(touched[op] / n, 2),
+            "rows_locked_per_row": round(locked[op] / n, 2) if read_locks else None,
+        })
+    lock_waits = locks_after.get("Innodb_row_lock_waits", 0) - locks_before.get("Innodb_row_lock_waits", 0)
+    lock_ms = locks_after.get("Innodb_row_lock_time", 0) - locks_before.get("Innodb_row_lock_time", 0)
+    return results, lock_waits, lock_ms
+
+
+def analyze_trigger(schema, table, candidate=None, exclude=None, sample_rows=50):
+    """
+    Benchmark per-row write cost on `table` in a scratch copy of `schema`.
+
+    `candidate` is a trigger dict shaped like an information_schema.triggers
+    row (TRIGGER_NAME, ACTION_TIMING, EVENT_MANIPULATION, EVENT_OBJECT_TABLE,
+    ACTION_STATEMENT). `exclude` names an existing trigger to leave out of the
+    "existing triggers" scenario, which is how an existing trigger is analysed.
+    Returns a list of report rows, one per scenario and operation.
+
+    Raises BenchmarkSkipped when the benchmark cannot run at all (no primary
+    key, no rows, or a trigger that would escape the sandbox); any other
+    error comes from actually executing the workload.
+    """
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    cursor.execute("SELECT CONNECTION_ID() AS id")
+    scratch = scratch_schema_name(schema, cursor.fetchone()["id"])
+    try:
+        triggers = existing_triggers(cursor, schema)
+        for trig in triggers + ([candidate] if candidate else []):
+            if references_live_schema(trig["ACTION_STATEMENT"], schema):
+                raise BenchmarkSkipped(
+                    f"Trigger `{trig['TRIGGER_NAME']}` references `{schema}` explicitly "
+                    f"and cannot be sandboxed. Use unqualified table names."
+                )
+        baseline_triggers = [t for t in triggers if t["TRIGGER_NAME"] != exclude]
+
+        columns, primary, unique = _columns(cursor, schema, table)
+        if not primary:
+            raise BenchmarkSkipped(f"Table `{table}` has no primary key; cannot address sample rows.")
+
+        _build_sandbox(cursor, schema, scratch, table, sample_rows)
+        cursor.execute(f"SELECT * FROM {_q(table)}")
+        rows = cursor.fetchall()
+        if not rows:
+            raise BenchmarkSkipped(f"Table `{table}` has no rows to sample.")
+        # (None, None) when no column can change: UPDATE is left out of the report
+        set_col, new_values = _update_values(columns, primary, unique, rows)
+        read_locks = _can_read_locks(cursor)
+
+        scenarios = [("no triggers", []), ("existing triggers", baseline_triggers)]
+        if candidate:
+            scenarios.append((f"existing + {candidate['TRIGGER_NAME']}", baseline_triggers + [candidate]))
+
+        report = []
+        base_touched = {}
+        for name, trigs in scenarios:
+            _set_triggers(cursor, scratch, trigs)
+            results, lock_waits, lock_ms = _run_workload(
+                conn, cursor, table, columns, primary, rows, set_col, new_values, read_locks
+            )
+            for r in results:
+                if name == "no triggers":
+                    base_touched[r["operation"]] = r["rows_touched_per_row"] or 1
+                r["write_amplification"] = round(r["rows_touched_per_row"] / base_touched[r["operation"]], 2)
+                r["server_lock_waits"] = lock_waits
+                r["server_lock_wait_ms"] = lock_ms
+                r["scenario"] = name
+                r["sample_rows"] = len(rows)
+                r["updated_column"] = set_col
+                report.append(r)
+        return report
+    finally:
+        try:
+            # Only ever drop the sandbox this run created
+            cursor.execute(f"DROP DATABASE IF EXISTS {_q(scratch)}")
+        except Exception:
+            pass
+        cursor.close()
+        conn.close()